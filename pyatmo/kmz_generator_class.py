@@ -1,14 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+from itertools import chain
+import logging
 import os
-from map_points import create_map, create_map_kml
+import time
 from pyatmo.logger import setup_logger
 from pyatmo.settings import LOGGER_NAME
 
-logger = setup_logger(LOGGER_NAME, "pyatmo_generator.log")
+logger = setup_logger(LOGGER_NAME, "pyatmo_generator.log", level_terminal=logging.WARNING)
+
+_HOME = os.path.expanduser('~')
 
 
 class KMZGenerator:
+    # Geometría centrada de la ventana, calculada con la primera instancia
+    _geometry = None
+
+    _TEAM_MODELS = {
+        "SIROCCO": ("ECMWF", "GFS_0.5", "GFS_0.25", "UKMET", "NCEP", "DWD", "METEOFRANCE", "CMCC", "JMA", "ICON"),
+        "NEBBO": ("ECMWF", "GFS_0.5", "GFS_0.25", "UKMET", "NCEP", "DWD", "METEOFRANCE", "CMCC", "JMA", "ECCC"),  # Añadir más modelos si es necesario
+    }
+    _TEAM_MODEL_SETS = {team: frozenset(models) for team, models in _TEAM_MODELS.items()}
+
     def __init__(self):
         logger.info("Initializing KMZGenerator")
         self.root = tk.Tk()
@@ -17,20 +30,23 @@ class KMZGenerator:
         self._set_window_position()
         self._set_style()
         self.team_var = tk.StringVar(value="SIROCCO")
+        self.entries: dict[str, ttk.Entry] = {}
         self._create_widgets()
 
     def _set_window_position(self):
-        logger.info("Setting window position")
-        window_width = 400
-        window_height = 600  # Aumentado a 600 para asegurar que haya espacio suficiente
-        screen_width = self.root.winfo_screenwidth()
-        screen_height = self.root.winfo_screenheight()
-        x = (screen_width - window_width) // 2
-        y = (screen_height - window_height) // 2
-        self.root.geometry(f'{window_width}x{window_height}+{x}+{y}')
+        logger.debug("Setting window position")
+        if KMZGenerator._geometry is None:
+            window_width = 400
+            window_height = 600  # Aumentado a 600 para asegurar que haya espacio suficiente
+            screen_width = self.root.winfo_screenwidth()
+            screen_height = self.root.winfo_screenheight()
+            x = (screen_width - window_width) // 2
+            y = (screen_height - window_height) // 2
+            KMZGenerator._geometry = f'{window_width}x{window_height}+{x}+{y}'
+        self.root.geometry(KMZGenerator._geometry)
 
     def _set_style(self):
-        logger.info("Setting style")
+        logger.debug("Setting style")
         self.style = ttk.Style()
         self.style.theme_use('clam')
         self.style.configure('TFrame', background='#E8E8E8')
@@ -41,7 +57,9 @@ class KMZGenerator:
         self.style.map('TButton', background=[('active', '#45a049')])
 
     def _create_widgets(self):
-        logger.info("Creating widgets")
+        start = time.perf_counter()
+        # Construir con la ventana oculta y mostrarla ya maquetada
+        self.root.withdraw()
         main_frame = ttk.Frame(self.root, padding="20 20 20 20", style='TFrame')
         main_frame.pack(fill=tk.BOTH, expand=True)
 
@@ -70,14 +88,14 @@ class KMZGenerator:
         self.models_frame = ttk.LabelFrame(main_frame, text="Modelos", style='TFrame')
         self.models_frame.pack(fill='x', pady=(10, 0))
 
-        self.model_vars = {}
+        self._create_model_checkbuttons()
         self._update_models()  # Ahora llamamos a _update_models después de crear models_frame
 
         # Número de puntos
         points_frame = ttk.Frame(main_frame, style='TFrame')
         points_frame.pack(fill='x', pady=(10, 0))
         ttk.Label(points_frame, text="Número de puntos:").pack(side=tk.LEFT, padx=(0, 5))
-        self.points_var = tk.StringVar(value="4")
+        self.points_var = tk.IntVar(value=4)
         ttk.Spinbox(points_frame, from_=1, to=10, textvariable=self.points_var, width=5).pack(side=tk.LEFT)
 
         # Botones
@@ -86,24 +104,45 @@ class KMZGenerator:
 
         self._create_button(button_frame, 'Generar KML', self.generate_kml)
         self._create_button(button_frame, 'Generar HTML', self.generate_html)
+        self.root.update_idletasks()
+        self.root.deiconify()
+        logger.info("Widgets built in %.1f ms", (time.perf_counter() - start) * 1000)
 
     def _update_models(self, event=None):
         selected_team = self.team_var.get()
-        logger.info(f"Updating models for team: {selected_team}")
+        logger.debug("Updating models for team: %s", selected_team)
         models = self._get_models_for_team(selected_team)
 
         # Actualizar etiquetas de latitud y longitud
         self._update_lat_lon_labels(selected_team)
 
-        # Limpiar modelos existentes
-        for widget in self.models_frame.winfo_children():
-            widget.destroy()
-
-        # Crear nuevos checkbuttons para los modelos
-        for i, model in enumerate(models):
-            var = tk.BooleanVar(value=model in ["ECMWF", "GFS_0.5"])
-            ttk.Checkbutton(self.models_frame, text=model, variable=var).grid(row=i//3, column=i%3, sticky='w', padx=5, pady=2)
-            self.model_vars[model] = var
+        # Mostrar solo los checkbuttons del equipo, en su orden, y ocultar el resto
+        active = {model: divmod(i, 3) for i, model in enumerate(models)}
+        defaults = {"ECMWF", "GFS_0.5"}
+        model_vars = self.model_vars
+        for model, checkbutton in self.model_checkbuttons.items():
+            cell = active.get(model)
+            if cell is None:
+                checkbutton.grid_remove()
+                model_vars[model].set(False)
+            else:
+                r, c = cell
+                checkbutton.grid(row=r, column=c, sticky='w', padx=5, pady=2)
+                model_vars[model].set(model in defaults)
+
+    def _create_model_checkbuttons(self):
+        # Un checkbutton por modelo de cualquier equipo; _update_models solo los muestra u oculta.
+        # Se crean en el orden de los equipos para conservar el orden de los modelos y del foco
+        all_models = dict.fromkeys(chain.from_iterable(self._TEAM_MODELS.values()))
+        Checkbutton = ttk.Checkbutton
+        BoolVar = tk.BooleanVar
+        models_frame = self.models_frame
+        self.model_vars = model_vars = {}
+        self.model_checkbuttons = model_checkbuttons = {}
+        for model in all_models:
+            var = BoolVar(value=False)
+            model_checkbuttons[model] = Checkbutton(models_frame, text=model, variable=var)
+            model_vars[model] = var
     
     def _update_lat_lon_labels(self, team):
         if team == "NEBBO":
@@ -117,21 +156,15 @@ class KMZGenerator:
             self.longitud_label.config(text="Longitud:")
 
     def _get_models_for_team(self, team):
-        logger.info(f"Getting models for team: {team}")
-        if team == "SIROCCO":
-            return ["ECMWF", "GFS_0.5", "GFS_0.25", "UKMET", "NCEP", "DWD", "METEOFRANCE", "CMCC", "JMA", "ICON"]
-        elif team == "NEBBO":
-            return ["ECMWF", "GFS_0.5", "GFS_0.25", "UKMET", "NCEP", "DWD", "METEOFRANCE", "CMCC", "JMA", "ECCC"]  # Añadir más modelos si es necesario
+        return self._TEAM_MODELS.get(team, ())
 
     def _create_input_field(self, parent, label_text):
-        logger.info(f"Creating input field: {label_text}")
         ttk.Label(parent, text=label_text).pack(anchor='w', pady=(10, 0))
         entry = ttk.Entry(parent, width=40)
         entry.pack(fill='x', pady=(5, 10))
-        setattr(self, label_text.lower().replace(' ', '_').replace(':', ''), entry)
+        self.entries[label_text] = entry
 
     def _create_button(self, parent, text, command):
-        logger.info(f"Creating button: {text}")
         ttk.Button(parent, text=text, command=command, width=15).pack(side=tk.LEFT, padx=5, pady=5, expand=True)
 
     def run(self):
@@ -140,7 +173,7 @@ class KMZGenerator:
 
     def _get_input_values(self):
         logger.info("Getting input values")
-        asset_name = self.nombre_del_asset.get().strip()
+        asset_name = self.entries['Nombre del asset:'].get().strip()
         if not asset_name:
             logger.error("Invalid asset name")
             messagebox.showerror('Error', 'Introduce un nombre de asset válido.')
@@ -149,7 +182,7 @@ class KMZGenerator:
             lat = float(self.latitud.get())
             lon = float(self.longitud.get())
             models = [model for model, var in self.model_vars.items() if var.get()]
-            n_points = int(self.points_var.get())
+            n_points = self.points_var.get()
             team = self.team_var.get()
 
             # Validate coordinates based on team
@@ -162,7 +195,7 @@ class KMZGenerator:
 
             logger.info(f"Input values: asset_name={asset_name}, lat={lat}, lon={lon}, models={models}, n_points={n_points}, team={team}")
             return asset_name, lat, lon, models, n_points, team
-        except ValueError as e:
+        except (ValueError, tk.TclError) as e:  # TclError: el Spinbox no contiene un entero
             logger.error(f"Invalid input values: {e}")
             messagebox.showerror('Error', f'Introduce valores válidos para latitud, longitud y número de puntos. {e}')
             return None, None, None, None, None, None
@@ -173,27 +206,23 @@ class KMZGenerator:
         if not asset_name:
             return
 
-        initial_dir = os.path.expanduser('~')
+        initial_dir = _HOME
         file_path = filedialog.asksaveasfilename(
             initialdir=initial_dir,
             title=f"Guardar archivo {file_type.upper()}",
             filetypes=[(f"{file_type.upper()} files", f"*.{file_type}")],
             defaultextension=f".{file_type}",
-            initialfile=f"{asset_name}.{file_type}"
+            initialfile=f"{asset_name}.{file_type}",
+            confirmoverwrite=True,  # El propio diálogo pregunta antes de sobrescribir
         )
 
         if not file_path:
             logger.info("File save operation cancelled")
             return
 
-        if os.path.exists(file_path):
-            overwrite = messagebox.askyesno('Archivo existente', 'El archivo ya existe. ¿Desea sobrescribirlo?')
-            if not overwrite:
-                logger.info("File overwrite cancelled")
-                return
-
         # Filtrar los modelos válidos para el equipo seleccionado
-        valid_models = [model for model in models if model in self._get_models_for_team(team)]
+        team_models = self._TEAM_MODEL_SETS.get(team, frozenset())
+        valid_models = [model for model in models if model in team_models]
         
         create_function(lat, lon, n_points, asset_name, os.path.dirname(file_path), models=valid_models, team=team)
         
@@ -202,10 +231,12 @@ class KMZGenerator:
 
     def generate_kml(self):
         logger.info("Generating KML")
+        from map_points import create_map_kml
         self._generate_file('kml', create_map_kml)
 
     def generate_html(self):
         logger.info("Generating HTML")
+        from map_points import create_map
         self._generate_file('html', create_map)
 
 
@@ -11,22 +11,53 @@ from typing import Optional
 
 from pyatmo.settings import LOGGER_NAME
 
+_FMT = "%(asctime)s [%(levelname)s] %(name)s - %(filename)s:%(lineno)d - %(message)s"
+_CHEAP_FMT = "%(asctime)s [%(levelname)s] %(message)s"
+_DATEFMT = "%Y-%m-%d %H:%M:%S"
+_FORMATTER = logging.Formatter(_FMT, datefmt=_DATEFMT)
+_CHEAP_FORMATTER = logging.Formatter(_CHEAP_FMT, datefmt=_DATEFMT)
+
+# Ficheros de log ya truncados en este proceso: solo se truncan la primera vez
+_truncated_files = set()
+
+
+class StructuredMessage:
+    """Log message with keyword context, serialised to JSON only if the record is emitted."""
+    __slots__ = ("message", "kwargs")
+
+    def __init__(self, message, **kwargs):
+        self.message = message
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return '%s %s' % (self.message, json.dumps(self.kwargs))
+
+
+def structlog(msg, *args, **kwargs):
+    return StructuredMessage(msg, **kwargs)
+
 
 def setup_logger(
         logger_name: str = LOGGER_NAME,
         file_name: Optional[str] = None,
-        level_terminal=logging.INFO,
+        level_terminal=logging.WARNING,
         level_file=logging.DEBUG,
         max_file_size=10 * 1024 * 1024,  # 10 MB
         backup_count=5,
-        truncate: bool = True,
+        truncate: bool = False,
+        console: bool = True,
 ) -> logging.Logger:
     """
     Sets up a structured logger with both console and file handlers.
 
     This function initializes a logger with a specified name and configures it with console and file handlers.
+    Calling it again with the same configuration returns the already configured logger untouched.
+    The console uses a short format; only the file handler records the source file and line.
     It supports structured logging by wrapping messages with additional keyword arguments into a JSON format.
     The file handler supports log rotation, limiting the log file size, and optionally truncating the log file at setup.
+    The log file is only opened when the first record is written to it.
+    The logger level follows the most verbose handler, so records that no handler would emit are
+    discarded before a LogRecord is even built.
 
     Parameters:
     -----------
@@ -35,7 +66,7 @@ def setup_logger(
     file_name : Optional[str], optional
         The path to the log file. If None, file logging is disabled.
     level_terminal : int, optional
-        The logging level for the console handler.
+        The logging level for the console handler. Default is WARNING.
     level_file : int, optional
         The logging level for the file handler.
     max_file_size : int, optional
@@ -43,7 +74,9 @@ def setup_logger(
     backup_count : int, optional
         The number of backup files to keep.
     truncate : bool, optional
-        If True, the log file is truncated at setup. Default is True.
+        If True, the log file is truncated the first time it is set up in the process. Default is False.
+    console : bool, optional
+        If False, no console handler is attached. Without console nor file, a NullHandler is used.
 
     Returns:
     --------
@@ -56,55 +89,54 @@ def setup_logger(
     >>> logger.info('This is an info message')
     """
     logger = logging.getLogger(logger_name)
+    config = (
+        logger_name, file_name, level_terminal, level_file, max_file_size, backup_count, truncate, console
+    )
+    if logger.handlers and getattr(logger, "_configured_for", None) == config:
+        return logger
+
     logger.setLevel(logging.DEBUG)
     logger.handlers.clear()
 
-    class StructuredMessage:
-        def __init__(self, message, **kwargs):
-            self.message = message
-            self.kwargs = kwargs
-
-        def __str__(self):
-            return '%s %s' % (self.message, json.dumps(self.kwargs))
-
-    def structlog(msg, *args, **kwargs):
-        return StructuredMessage(msg, **kwargs)
-
     logger.structlog = structlog
 
     # Console handler
-    ch = logging.StreamHandler()
-    ch.setLevel(level_terminal)
-    console_formatter = logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(name)s - %(filename)s:%(lineno)d - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    ch.setFormatter(console_formatter)
-    logger.addHandler(ch)
+    if console:
+        ch = logging.StreamHandler()
+        ch.setLevel(level_terminal)
+        ch.setFormatter(_CHEAP_FORMATTER)
+        logger.addHandler(ch)
 
     # File handler
     if file_name:
         try:
-            if truncate and os.path.exists(file_name):
-                os.remove(file_name)
+            file_path = os.path.abspath(file_name)
+            if truncate and file_path not in _truncated_files:
+                _truncated_files.add(file_path)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
 
             fh = RotatingFileHandler(
                 file_name,
                 mode="a",  # Always append, we've already handled truncation if needed
                 maxBytes=max_file_size,
-                backupCount=backup_count
+                backupCount=backup_count,
+                delay=True,
             )
             fh.setLevel(level_file)
-            file_formatter = logging.Formatter(
-                "%(asctime)s [%(levelname)s] %(name)s - %(filename)s:%(lineno)d - %(message)s",
-                datefmt="%Y-%m-%d %H:%M:%S"
-            )
-            fh.setFormatter(file_formatter)
+            fh.setFormatter(_FORMATTER)
             logger.addHandler(fh)
         except Exception as e:
             logger.error(f"Error creating file handler: {e}", exc_info=True)
 
+    if logger.handlers:
+        logger.setLevel(min(h.level for h in logger.handlers))
+    else:
+        logger.addHandler(logging.NullHandler())
+        logger.setLevel(logging.CRITICAL)
+
     logger.propagate = False
+    logger._configured_for = config
     return logger
 
 
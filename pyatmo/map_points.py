@@ -1,16 +1,39 @@
+import logging
+import math
 import os
 from collections import defaultdict
+from collections.abc import Mapping
+from functools import lru_cache
+from types import MappingProxyType
 from typing import List, Tuple
 
 import folium
 import numpy as np
-import pandas as pd
 import simplekml
 
 from pyatmo.logger import setup_logger
 from pyatmo.settings import LOGGER_NAME
 
-logger = setup_logger(LOGGER_NAME, "pyatmo.log")
+# Si la aplicación (p. ej. la GUI) ya configuró el logger compartido, se respeta su configuración
+logger = logging.getLogger(LOGGER_NAME)
+if not logger.handlers:
+    logger = setup_logger(LOGGER_NAME, "pyatmo.log")
+
+
+# Decimales de las coordenadas de malla: muy por debajo de cualquier paso de modelo
+_AXIS_DECIMALS = 10
+
+
+@lru_cache(maxsize=None)
+def _arange(start: float, stop: float, step: float) -> np.ndarray:
+    """Eje de malla de solo lectura, compartido entre selectores con el mismo rango y paso.
+
+    Los valores se redondean para eliminar el error acumulado de np.arange (40.1999999999926 -> 40.2):
+    así un mismo punto de dos mallas distintas es la misma tupla y se agrupa como punto común.
+    """
+    axis = np.round(np.arange(start, stop, step), _AXIS_DECIMALS)
+    axis.setflags(write=False)
+    return axis
 
 
 class GridPointSelector:
@@ -25,25 +48,234 @@ class GridPointSelector:
         logger.info(
             f"Initializing GridPointSelector with name={name}, lat_range={lat_range}, lon_range={lon_range}, step={step}"
         )
-        self.lats = np.arange(lat_range[0], lat_range[1] + step, step)
-        self.lons = np.arange(lon_range[0], lon_range[1] + step, step)
-        self.points = [(lat, lon) for lat in self.lats for lon in self.lons]
+        # La malla es regular: basta con los ejes 1-D, sin materializar el producto cartesiano
+        self.lats = _arange(lat_range[0], lat_range[1] + step, step)
+        self.lons = _arange(lon_range[0], lon_range[1] + step, step)
+        self.lat0 = lat_range[0]
+        self.lon0 = lon_range[0]
+        self.step = step
+        self.nlat = len(self.lats)
+        self.nlon = len(self.lons)
 
     def select_closest_points(
         self, latitude: float, longitude: float, n_points: int = 4
     ) -> List[Tuple[float, float]]:
-        logger.info(
-            f"Selecting {n_points} closest points to latitude={latitude}, longitude={longitude}"
+        n_points = min(n_points, self.nlat * self.nlon)
+        if n_points <= 0:
+            return []
+
+        # Nodo de la malla más cercano, calculado analíticamente
+        i0 = min(max(round((latitude - self.lat0) / self.step), 0), self.nlat - 1)
+        j0 = min(max(round((longitude - self.lon0) / self.step), 0), self.nlon - 1)
+
+        # Vecindario cuadrado alrededor del nodo; se amplía si algún punto fuera de él pudiera estar más cerca
+        radius = math.isqrt(n_points - 1) + 2  # ceil(sqrt(n_points)) + 1
+        while True:
+            i_lo, i_hi = max(i0 - radius, 0), min(i0 + radius + 1, self.nlat)
+            j_lo, j_hi = max(j0 - radius, 0), min(j0 + radius + 1, self.nlon)
+            dlat2 = (self.lats[i_lo:i_hi] - latitude) ** 2
+            dlon2 = (self.lons[j_lo:j_hi] - longitude) ** 2
+            d2 = (dlat2[:, None] + dlon2[None, :]).ravel()
+
+            # Cota inferior de la distancia de cualquier nodo fuera del vecindario
+            outside = [
+                dlat2[0] if i_lo > 0 else np.inf,
+                dlat2[-1] if i_hi < self.nlat else np.inf,
+                dlon2[0] if j_lo > 0 else np.inf,
+                dlon2[-1] if j_hi < self.nlon else np.inf,
+            ]
+            if d2.size >= n_points:
+                part = np.argpartition(d2, n_points - 1)[:n_points]
+                if d2[part].max() <= min(outside):
+                    break
+            radius *= 2
+
+        closest_indices = part[np.argsort(d2[part], kind="stable")]
+        rows, cols = np.divmod(closest_indices, j_hi - j_lo)
+        closest_points = list(
+            zip(self.lats[i_lo + rows].tolist(), self.lons[j_lo + cols].tolist())
         )
-        distances = [
-            np.sqrt((point[0] - latitude) ** 2 + (point[1] - longitude) ** 2)
-            for point in self.points
-        ]
-        closest_indices = np.argsort(distances)[:n_points]
-        closest_points = [self.points[i] for i in closest_indices]
-        logger.debug(f"Closest points: {closest_points}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Closest points: %s", closest_points)
         return closest_points
 
+    def select_closest_points_batch(
+        self, latitudes, longitudes, n_points: int = 4
+    ) -> np.ndarray:
+        """
+        Versión vectorizada de select_closest_points para muchos puntos objetivo.
+
+        Devuelve un array (n_objetivos, n_points, 2) con los (lat, lon) de los nodos más cercanos a
+        cada objetivo, ordenados por distancia. n_points se limita al número de nodos de la malla.
+        Lanza ValueError si latitudes y longitudes no tienen la misma longitud.
+        """
+        lat_q = np.asarray(latitudes, dtype=float).ravel()
+        lon_q = np.asarray(longitudes, dtype=float).ravel()
+        if lat_q.size != lon_q.size:
+            raise ValueError(
+                f"latitudes and longitudes must have the same length ({lat_q.size} != {lon_q.size})"
+            )
+        n_points = max(min(n_points, self.nlat * self.nlon), 0)
+        closest = np.empty((lat_q.size, n_points, 2))
+        if n_points == 0 or lat_q.size == 0:
+            return closest
+
+        # Mismo vecindario que select_closest_points, con radio fijo para todos los objetivos
+        radius = math.isqrt(n_points - 1) + 2
+        offsets = np.arange(-radius, radius + 1)
+        i0 = np.clip(np.rint((lat_q - self.lat0) / self.step).astype(int), 0, self.nlat - 1)
+        j0 = np.clip(np.rint((lon_q - self.lon0) / self.step).astype(int), 0, self.nlon - 1)
+        ii = i0[:, None] + offsets
+        jj = j0[:, None] + offsets
+        inside_i = (ii >= 0) & (ii < self.nlat)
+        inside_j = (jj >= 0) & (jj < self.nlon)
+        ii = np.clip(ii, 0, self.nlat - 1)
+        jj = np.clip(jj, 0, self.nlon - 1)
+        # Los índices fuera de la malla quedan a distancia infinita
+        dlat2 = np.where(inside_i, (self.lats[ii] - lat_q[:, None]) ** 2, np.inf)
+        dlon2 = np.where(inside_j, (self.lons[jj] - lon_q[:, None]) ** 2, np.inf)
+        d2 = (dlat2[:, :, None] + dlon2[:, None, :]).reshape(lat_q.size, -1)
+
+        part = np.argpartition(d2, n_points - 1, axis=1)[:, :n_points]
+        part_d2 = np.take_along_axis(d2, part, axis=1)
+        order = np.argsort(part_d2, axis=1, kind="stable")
+        rows, cols = np.divmod(np.take_along_axis(part, order, axis=1), offsets.size)
+        closest[:, :, 0] = self.lats[np.take_along_axis(ii, rows, axis=1)]
+        closest[:, :, 1] = self.lons[np.take_along_axis(jj, cols, axis=1)]
+
+        # Objetivos cuyo vecindario no garantiza el resultado (bordes, fuera de la malla): vía escalar
+        outside = np.minimum.reduce([
+            np.where(ii[:, 0] > 0, dlat2[:, 0], np.inf),
+            np.where(ii[:, -1] < self.nlat - 1, dlat2[:, -1], np.inf),
+            np.where(jj[:, 0] > 0, dlon2[:, 0], np.inf),
+            np.where(jj[:, -1] < self.nlon - 1, dlon2[:, -1], np.inf),
+        ])
+        for t in np.flatnonzero(~(part_d2.max(axis=1) <= outside)):
+            closest[t] = self.select_closest_points(lat_q[t], lon_q[t], n_points)
+        return closest
+
+
+# Color de los marcadores folium por modelo
+_COLOR_MAP = MappingProxyType({
+    "GFS_0.5": "red",
+    "GFS_0.25": "darkred",
+    "ECMWF": "green",
+    "UKMET": "blue",
+    "NCEP": "orange",
+    "DWD": "orange",
+    "METEOFRANCE": "darkred",
+    "CMCC": "darkgreen",
+    "JMA": "darkblue",
+    "ICON": "purple",
+    "ECCC": "pink",
+    "COMMON": "cadetblue",
+    "OBJECTIVE": "black",
+})
+
+# Valores RGB de los nombres de color de folium, para los iconos KML
+_NAMED_RGB = {
+    "red": (255, 0, 0),
+    "darkred": (139, 0, 0),
+    "green": (0, 128, 0),
+    "blue": (0, 0, 255),
+    "orange": (255, 165, 0),
+    "darkgreen": (0, 100, 0),
+    "darkblue": (0, 0, 139),
+    "purple": (128, 0, 128),
+    "cadetblue": (95, 158, 160),
+    "pink": (255, 192, 203),
+    "black": (0, 0, 0),
+}
+# Color KML de cada modelo, calculado una sola vez
+_KML_COLORS = MappingProxyType({
+    model: simplekml.Color.rgb(*_NAMED_RGB[color]) for model, color in _COLOR_MAP.items()
+})
+_KML_PURPLE = simplekml.Color.rgb(*_NAMED_RGB["purple"])
+
+# Desde folium 0.20 cada marcador enlaza su icono con Marker.SetIcon, así que un mismo Icon puede
+# compartirse; en versiones anteriores el Icon se vincula a su marcador padre y hay que crear uno por marcador
+_ICONS_SHAREABLE = hasattr(folium.Marker, "SetIcon")
+
+# Mallas (lat_range, lon_range, step) de cada modelo por equipo
+_COMMON_GRIDS = {
+    "GFS_0.5": ((-90.0, 90.0), (-180.0, 180.0), 0.5),
+    "GFS_0.25": ((-90.0, 90.0), (-180.0, 180.0), 0.25),
+}
+
+_MODEL_GRIDS = {
+    "SIROCCO": {
+        "ECMWF": ((-90.0, 90.0), (-180.0, 180.0), 0.1),
+        "UKMET": ((-90.0, 90.0), (-180.0, 180.0), 0.2),
+        "NCEP": ((-90.0, 90.0), (-180.0, 180.0), 0.25),
+        "DWD": ((-90.0, 90.0), (-180.0, 180.0), 0.1),
+        "METEOFRANCE": ((-90.0, 90.0), (-180.0, 180.0), 0.1),
+        "CMCC": ((-90.0, 90.0), (-180.0, 180.0), 0.25),
+        "JMA": ((-90.0, 90.0), (-180.0, 180.0), 0.2),
+        "ICON": ((29.5, 70.5), (336.5, 62.5), 0.0625),
+        **_COMMON_GRIDS,
+    },
+    "NEBBO": {
+        "ECMWF": ((-89.5, 89.5), (0.5, 359.5), 1.0),
+        "UKMET": ((-89.5, 89.5), (0.5, 359.5), 1.0),
+        "NCEP": ((-89.5, 89.5), (0.5, 359.5), 1.0),
+        "DWD": ((-89.5, 89.5), (0.5, 359.5), 1.0),
+        "METEOFRANCE": ((-89.5, 89.5), (0.5, 359.5), 1.0),
+        "CMCC": ((-89.5, 89.5), (0.5, 359.5), 1.0),
+        "JMA": ((-90.0, 90.0), (0.0, 358.75), 1.25),
+        "ECCC": ((-89.5, 89.5), (0.5, 359.5), 1.0),
+        **_COMMON_GRIDS,
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def _build_selector(
+    lat_range: Tuple[float, float],
+    lon_range: Tuple[float, float],
+    step: float,
+) -> GridPointSelector:
+    """Selector compartido por todos los modelos y equipos que usan la misma malla."""
+    return GridPointSelector(lat_range, lon_range, step, name=f"{lat_range}x{lon_range}@{step}")
+
+
+def _full_path(filename, path_file, extension):
+    if path_file is not None:
+        if filename is None:
+            filename = f"closest_points_map.{extension}"
+        elif not filename.lower().endswith(f".{extension}"):
+            filename = f"{filename}.{extension}"
+        full_path = os.path.join(path_file, filename)
+    else:
+        full_path = (
+            filename
+            if filename.lower().endswith(f".{extension}")
+            else f"{filename}.{extension}"
+        )
+    return full_path
+
+
+class _LazySelectors(Mapping):
+    """Mapping modelo -> GridPointSelector que construye cada selector en su primer acceso."""
+
+    def __init__(self, specs):
+        self._specs = specs
+        self._selectors = {}
+
+    def __getitem__(self, model):
+        selector = self._selectors.get(model)
+        if selector is None:
+            selector = self._selectors[model] = _build_selector(*self._specs[model])
+        return selector
+
+    def __contains__(self, model):
+        return model in self._specs
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
 
 class MapGenerator:
     def __init__(self, team="SIROCCO"):
@@ -53,49 +285,37 @@ class MapGenerator:
 
     def _update_model_selectors(self):
         logger.info("Updating model selectors")
-        common_models = {
-            "GFS_0.5": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.5),
-            "GFS_0.25": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.25),
-        }
-
-        if self.team == "SIROCCO":
-            self.model_selectors = {
-                "ECMWF": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.1),
-                "UKMET": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.2),
-                "NCEP": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.25),
-                "DWD": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.1),
-                "METEOFRANCE": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.1),
-                "CMCC": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.25),
-                "JMA": GridPointSelector((-90.0, 90.0), (-180.0, 180.0), 0.2),
-                "ICON": GridPointSelector((29.5, 70.5), (336.5, 62.5), 0.0625),
-                **common_models,
-            }
-        elif self.team == "NEBBO":
-            self.model_selectors = {
-                "ECMWF": GridPointSelector((-89.5, 89.5), (0.5, 359.5), 1.0),
-                "UKMET": GridPointSelector((-89.5, 89.5), (0.5, 359.5), 1.0),
-                "NCEP": GridPointSelector((-89.5, 89.5), (0.5, 359.5), 1.0),
-                "DWD": GridPointSelector((-89.5, 89.5), (0.5, 359.5), 1.0),
-                "METEOFRANCE": GridPointSelector((-89.5, 89.5), (0.5, 359.5), 1.0),
-                "CMCC": GridPointSelector((-89.5, 89.5), (0.5, 359.5), 1.0),
-                "JMA": GridPointSelector((-90.0, 90.0), (0.0, 358.75), 1.25),
-                "ECCC": GridPointSelector((-89.5, 89.5), (0.5, 359.5), 1.0),
-                **common_models,
-            }
-        logger.debug(f"Model selectors: {self.model_selectors}")
+        self._selector_specs = _MODEL_GRIDS.get(self.team, {})
+        self.model_selectors = _LazySelectors(self._selector_specs)
+        logger.debug("Model grids: %s", self._selector_specs)
+
+    def _get_selector(self, model):
+        return self.model_selectors[model]
+
+    def _closest_points(self, models, latitude, longitude, n_points):
+        # Una sola búsqueda por malla distinta; los modelos que la comparten reciben el mismo resultado
+        selectors = {model: self._get_selector(model) for model in models}
+        results = {}
+        for selector in selectors.values():
+            if id(selector) not in results:
+                results[id(selector)] = selector.select_closest_points(
+                    latitude, longitude, n_points
+                )
+        return {model: results[id(selector)] for model, selector in selectors.items()}
 
     def create_map(self, latitude, longitude, n_points, filename, path_file, models):
         logger.info(
             f"Creating map for latitude={latitude}, longitude={longitude}, n_points={n_points}, filename={filename}, path_file={path_file}, models={models}"
         )
-        closest_points = {}
+        available_models = []
         for model in models:
-            if model in self.model_selectors:
-                closest_points[model] = self.model_selectors[
-                    model
-                ].select_closest_points(latitude, longitude, n_points)
+            if model in self._selector_specs:
+                available_models.append(model)
             else:
                 logger.warning(f"Model {model} not available for team {self.team}")
+        closest_points = self._closest_points(
+            available_models, latitude, longitude, n_points
+        )
 
         m = folium.Map(location=[latitude, longitude], zoom_start=6)
 
@@ -105,22 +325,31 @@ class MapGenerator:
             for point in points:
                 point_groups[point].append(model)
 
-        colors = self._get_color_map()
-
-        # Crear marcadores para cada grupo de puntos
+        # Crear marcadores para cada grupo de puntos, con un icono por color, en una capa
+        # que se añade al mapa una sola vez
+        icons = {}
+        group = folium.FeatureGroup(name="Puntos de malla")
         for point, models_list in point_groups.items():
-            popup_text = "<br>".join(
-                [f"{model}: ({point[0]:.2f}, {point[1]:.2f})" for model in models_list]
+            coords = f"({point[0]:.2f}, {point[1]:.2f})"
+            popup_text = "<br>".join([f"{model}: {coords}" for model in models_list])
+            color = self._get_group_color(models_list)
+            icon = icons.get(color)
+            if icon is None:
+                icon = folium.Icon(color=color)
+                if _ICONS_SHAREABLE:
+                    icons[color] = icon
+            group.add_child(
+                folium.Marker(
+                    location=[point[0], point[1]],
+                    popup=folium.Popup(popup_text, max_width=300),
+                    icon=icon,
+                )
             )
-            folium.Marker(
-                location=[point[0], point[1]],
-                popup=folium.Popup(popup_text, max_width=300),
-                icon=folium.Icon(color=self._get_group_color(models_list, colors)),
-            ).add_to(m)
+        m.add_child(group)
 
         folium.Marker(location=[latitude, longitude], popup="POINT").add_to(m)
 
-        filename = self._get_full_path(filename, path_file, "html")
+        filename = _full_path(filename, path_file, "html")
         m.save(filename)
         logger.info(f"Map saved to {filename}")
 
@@ -136,12 +365,7 @@ class MapGenerator:
         logger.info(
             f"Creating KML map for latitude={latitude}, longitude={longitude}, n_points={n_points}, filename={filename}, path_file={path_file}, models={models}"
         )
-        closest_points = {
-            model: self.model_selectors[model].select_closest_points(
-                latitude, longitude, n_points
-            )
-            for model in models
-        }
+        closest_points = self._closest_points(models, latitude, longitude, n_points)
 
         # Agrupar puntos coincidentes
         point_groups = defaultdict(list)
@@ -150,115 +374,38 @@ class MapGenerator:
                 point_groups[point].append(model)
 
         kml = simplekml.Kml()
-        color_map = self._get_color_map()
-
         for point, models_list in point_groups.items():
             description = ", ".join(models_list)
             placemark = kml.newpoint(
                 name=f"({point[0]:.2f}, {point[1]:.2f})", coords=[(point[1], point[0])]
             )
             placemark.description = description
-            placemark.style.iconstyle.color = simplekml.Color.rgb(
-                *self._get_kml_color(models_list, color_map)
-            )
+            placemark.style.iconstyle.color = self._get_kml_color(models_list)
 
         # Punto objetivo
         kml.newpoint(name="OBJECTIVE", coords=[(longitude, latitude)])
 
-        filename = self._get_full_path(filename, path_file, "kml")
+        filename = _full_path(filename, path_file, "kml")
         kml.save(filename)
         logger.info(f"KML map saved to {filename}")
 
     @staticmethod
-    def _get_group_color(models, color_map):
+    def _get_group_color(models):
         if len(models) == 1:
-            return color_map[models[0]]
+            return _COLOR_MAP[models[0]]
         return "purple"  # Color para puntos que coinciden en múltiples modelos
 
     @staticmethod
-    def _get_kml_color(models, color_map):
+    def _get_kml_color(models):
         if len(models) == 1:
-            return [int(x) for x in bytes.fromhex(color_map[models[0]][1:])]
-        return [128, 0, 128]  # Purple for multiple models
-
-    @staticmethod
-    def _add_markers(m, points, common_points, color, label):
-        logger.debug(f"Adding markers with color={color} and label={label}")
-        for point in points:
-            if point in common_points:
-                continue
-            folium.Marker(
-                location=[point[0], point[1]],
-                popup=f"({point[0]:.2f}, {point[1]:.2f}) {label}",
-                icon=folium.Icon(color=color),
-            ).add_to(m)
-
-    @staticmethod
-    def _prepare_kml_data(closest_points, common_points, latitude, longitude):
-        logger.debug("Preparing KML data")
-        data = []
-        for model, points in closest_points.items():
-            data.extend(
-                [(point, model) for point in points if point not in common_points]
-            )
-        data.extend([(point, "COMMON") for point in common_points])
-        data.append(((latitude, longitude), "OBJECTIVE"))
-
-        df = pd.DataFrame(data, columns=["COORDS", "TYPE"])
-        df["LAT"] = df["COORDS"].apply(lambda x: x[0])
-        df["LON"] = df["COORDS"].apply(lambda x: x[1])
-        logger.debug(f"KML data prepared: {df}")
-        return df
+            return _KML_COLORS[models[0]]
+        return _KML_PURPLE  # Purple for multiple models
 
-    @staticmethod
-    def _get_color_map():
-        logger.debug("Getting color map")
-        return {
-            "GFS_0.5": "red",
-            "GFS_0.25": "darkred",
-            "ECMWF": "green",
-            "UKMET": "blue",
-            "NCEP": "orange",
-            "DWD": "orange",
-            "METEOFRANCE": "darkred",
-            "CMCC": "darkgreen",
-            "JMA": "darkblue",
-            "ICON": "purple",
-            "COMMON": "cadetblue",
-            "OBJECTIVE": "black",
-        }
 
-    @staticmethod
-    def _add_kml_placemarks(kml, data, color_map):
-        logger.debug("Adding KML placemarks")
-        for _, row in data.iterrows():
-            placemark = kml.newpoint(
-                name=row["TYPE"], coords=[(row["LON"], row["LAT"])]
-            )
-            placemark.style.labelstyle.color = simplekml.Color.red
-            placemark.style.iconstyle.color = simplekml.Color.rgb(
-                *[int(x) for x in bytes.fromhex(color_map[row["TYPE"]][1:])]
-            )
-
-    @staticmethod
-    def _get_full_path(filename, path_file, extension):
-        logger.debug(
-            f"Getting full path for filename={filename}, path_file={path_file}, extension={extension}"
-        )
-        if path_file is not None:
-            if filename is None:
-                filename = f"closest_points_map.{extension}"
-            elif not filename.lower().endswith(f".{extension}"):
-                filename = f"{filename}.{extension}"
-            full_path = os.path.join(path_file, filename)
-        else:
-            full_path = (
-                filename
-                if filename.lower().endswith(f".{extension}")
-                else f"{filename}.{extension}"
-            )
-        logger.debug(f"Full path: {full_path}")
-        return full_path
+@lru_cache(maxsize=None)
+def _get_generator(team: str) -> MapGenerator:
+    """MapGenerator reutilizado por create_map y create_map_kml en todas las llamadas del mismo equipo."""
+    return MapGenerator(team)
 
 
 # Modificar las funciones create_map y create_map_kml para que acepten el parámetro 'team'
@@ -272,7 +419,7 @@ def create_map(
     team: str = "SIROCCO",
 ):
     logger.info(f"Creating map with team={team}")
-    MapGenerator(team).create_map(
+    _get_generator(team).create_map(
         latitude, longitude, n_points, filename, path_file, models
     )
 
@@ -287,6 +434,6 @@ def create_map_kml(
     team: str = "SIROCCO",
 ):
     logger.info(f"Creating KML map with team={team}")
-    MapGenerator(team).create_map_kml(
+    _get_generator(team).create_map_kml(
         latitude, longitude, n_points, filename, path_file, models
     )